@@ -2,14 +2,10 @@
 from flask import Flask
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output, State  # Added State here
-import sqlite3
+from dash.dependencies import Input, Output
 import pandas as pd
-import os
-import plotly.express as px
 import numpy as np
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from db import prepare_database, read_sql_parallel, time_columns, parse_time
 
 
 # Initialize Flask
@@ -18,41 +14,46 @@ server = Flask(__name__)
 # Initialize Dash
 app = dash.Dash(__name__, server=server)
 
-# Database path
-DB_PATH = os.path.join('data', 'text.db')
-
-# Add database path verification
-if not os.path.exists(DB_PATH):
-    print(f"Database file not found at: {DB_PATH}")
-    print(f"Current working directory: {os.getcwd()}")
+prepare_database()
 
 def load_data():
     try:
-        # Create a new connection each time
-        with sqlite3.connect(DB_PATH) as conn:
-            df = pd.read_sql('SELECT * FROM main_data', conn)
-            df_rpm = pd.read_sql('SELECT * FROM rpm', conn)
-            df1 = pd.read_sql('SELECT * FROM corruption_status', conn)
-            
-            # Merge dataframes
-            merged_df1 = pd.merge(df, df1, on='id', how='inner')
-            merged_df2 = pd.merge(df, df_rpm, on='id', how='inner')
-            
-            # Convert time columns
-            merged_df1['time'] = pd.to_datetime(merged_df1['time'])
-            merged_df2['time'] = pd.to_datetime(merged_df2['time'])
-            
-            return merged_df1, merged_df2
+        # Only fetch the columns the dashboard uses
+        df, df1 = read_sql_parallel(
+            (f'SELECT id, {time_columns()} FROM main_data',),
+            ('SELECT * FROM corruption_status',),
+        )
+        
+        # Convert times before downcasting so epoch seconds keep full precision
+        df = parse_time(df)
+        
+        # Downcast to save memory: 0/1 corruption flags to int8, ids to int32
+        flag_cols = [c for c in df1.columns if c != 'id']
+        df1[flag_cols] = df1[flag_cols].fillna(0).astype('int8')
+        for frame in (df, df1):
+            frame['id'] = frame['id'].astype('int32')
+        
+        # Merge dataframes
+        merged_df1 = pd.merge(df, df1, on='id', how='inner')
+
+        # Rows without a time never fall in any year/week, so drop them up front
+        merged_df1 = merged_df1[merged_df1['time'].notna()]
+
+        # Calendar keys, derived once so nothing re-runs datetime accessors
+        merged_df1['_year'] = merged_df1['time'].dt.year.astype('int16')
+        merged_df1['_week'] = merged_df1['time'].dt.isocalendar().week.astype('int16')
+        
+        return merged_df1
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         raise
 
 # Load initial data
-merged_df1, merged_df2 = load_data()
+merged_df1 = load_data()
 
 
 # Get unique years from the dataset
-years = sorted(merged_df1['time'].dt.year.unique())
+years = sorted(merged_df1['_year'].unique())
 
 # Define all channel-sensor combinations
 sensors = []
@@ -60,6 +61,62 @@ for ch in ['ch1', 'ch2', 'ch3']:
     for s in ['s1', 's2', 's3', 's4', 's5', 's6']:
         sensors.append(f'{ch}{s}')
 
+# Turn one year's weekly totals/corruption counts (weeks 1-53) into 7x8 heatmap matrices
+def build_weekly_matrix(total, corrupted):
+    weekly_stats = pd.DataFrame({'week': range(1, 54), 'total': total, 'corrupted': corrupted})
+    
+    # Calculate corruption percentage
+    weekly_stats['corruption_percentage'] = (weekly_stats['corrupted'] / weekly_stats['total'] * 100)
+    weekly_stats = weekly_stats.fillna(0)
+    
+    # Pad to 56 weeks and reshape into a matrix (7 rows x 8 columns)
+    # Reverse the row order so week 1 starts at the top
+    weekly_stats = weekly_stats.reindex(range(56), fill_value=0)
+    percentage = weekly_stats['corruption_percentage'].to_numpy(dtype=float)
+    matrix_data = percentage.reshape(7, 8)[::-1]
+    
+    # Full cell labels, built once here instead of formatted per cell by Plotly
+    week_text = ('Week ' + weekly_stats['week'].astype(int).astype(str) +
+                 '<br>' + weekly_stats['total'].astype(int).astype(str) + ' total' +
+                 '<br>' + weekly_stats['corrupted'].astype(int).astype(str) + ' corrupted'
+                 ).to_numpy(dtype=str)
+    week_text[53:] = ''  # Padding cells carry no week label
+    matrix_text = np.char.add(week_text, np.char.mod('<br>%.1f%% corrupted', percentage))
+    matrix_text = matrix_text.reshape(7, 8)[::-1]
+    
+    return matrix_data, matrix_text
+
+# Precompute every (year, sensor) heatmap once; the callback is just a lookup
+def build_heatmaps():
+    # Dense (year, week) bucket for every row, so counting is a single bincount
+    n_buckets = len(years) * 54
+    year_idx = np.searchsorted(np.asarray(years), merged_df1['_year'].to_numpy())
+    bucket = year_idx * 54 + merged_df1['_week'].to_numpy()
+    
+    # Total samples per bucket, shared by every sensor
+    totals = np.bincount(bucket, minlength=n_buckets).reshape(len(years), 54)
+    
+    heatmaps = {}
+    for sensor in sensors:
+        # Count of corruption markings (1s) per bucket
+        flags = merged_df1[sensor].to_numpy() == 1
+        corrupted = np.bincount(bucket, weights=flags, minlength=n_buckets).reshape(len(years), 54)
+        for i, y in enumerate(years):
+            heatmaps[(int(y), sensor)] = build_weekly_matrix(totals[i, 1:], corrupted[i, 1:])
+    return heatmaps
+
+HEATMAPS = build_heatmaps()
+
+# Static heatmap layout built once; callbacks only add the trace and title.
+# Kept as a plain dict so plotly.graph_objects is only imported by the callback.
+_HEATMAP_LAYOUT = dict(
+    height=800,
+    width=1200,
+    showlegend=False,
+    xaxis=dict(showticklabels=False),
+    yaxis=dict(showticklabels=False),
+)
+
 app.layout = html.Div([
     html.H1("Weekly Sensor Performance Dashboard"),
     
@@ -94,53 +151,18 @@ app.layout = html.Div([
      Input('sensor-dropdown', 'value')]
 )
 def update_heatmap(selected_year, selected_sensor):
-    # Filter data for selected year
-    mask = merged_df1['time'].dt.year == selected_year
-    df_year = merged_df1[mask].copy()
-    
-    # Add week number to the dataframe
-    df_year['week'] = df_year['time'].dt.isocalendar().week
+    import plotly.graph_objects as go
     
-    # Count actual corruption markings (1s) for the selected sensor
-    df_year['is_corrupted'] = (df_year[selected_sensor] == 1).astype(int)
+    matrix_data, matrix_text = HEATMAPS[(selected_year, selected_sensor)]
     
-    # Group by week and calculate metrics
-    weekly_stats = df_year.groupby('week').agg({
-        'id': 'count',  # Total samples
-        'is_corrupted': 'sum'  # Count of corruption markings (1s)
-    }).reset_index()
-    
-    # Calculate corruption percentage
-    weekly_stats['corruption_percentage'] = (weekly_stats['is_corrupted'] / weekly_stats['id'] * 100)
-    
-    # Create a complete range of weeks (1-53)
-    all_weeks = pd.DataFrame({'week': range(1, 54)})
-    weekly_stats = pd.merge(all_weeks, weekly_stats, on='week', how='left')
-    weekly_stats = weekly_stats.fillna(0)
-    
-    # Reshape data into a matrix (7 rows x 8 columns to show 53 weeks)
-    # Reverse the row order so week 1 starts at the top
-    matrix_data = np.zeros((7, 8))  # Initialize with zeros
-    matrix_text = np.empty((7, 8), dtype='object')  # For text labels
-    
-    for i in range(53):
-        row = 6 - (i // 8)  # Reverse row order
-        col = i % 8
-        if i < len(weekly_stats):
-            matrix_data[row, col] = weekly_stats['corruption_percentage'].iloc[i]
-            total_samples = weekly_stats['id'].iloc[i]
-            corrupted_count = weekly_stats['is_corrupted'].iloc[i]
-            week_num = weekly_stats['week'].iloc[i]
-            matrix_text[row, col] = f'Week {week_num}<br>{int(total_samples)} total<br>{int(corrupted_count)} corrupted'
-    
-    # Create figure
-    fig = go.Figure()
+    # Create figure from the shared static layout
+    fig = go.Figure(layout=_HEATMAP_LAYOUT)
     
     # Add heatmap trace
     fig.add_trace(go.Heatmap(
         z=matrix_data,
         text=matrix_text,
-        texttemplate="%{text}<br>%{z:.1f}% corrupted",
+        texttemplate="%{text}",
         textfont={"size": 10},
         colorscale=[
             [0, 'green'],     # 0% corruption
@@ -153,17 +175,7 @@ def update_heatmap(selected_year, selected_sensor):
         zmax=100  # Set maximum value to 100 since it's a percentage
     ))
     
-    # Update layout
-    fig.update_layout(
-        title=f'Weekly Corruption Status for {selected_sensor} ({selected_year})',
-        height=800,
-        width=1200,
-        showlegend=False,
-    )
-    
-    # Update axes
-    fig.update_xaxes(showticklabels=False)
-    fig.update_yaxes(showticklabels=False)
+    fig.update_layout(title=f'Weekly Corruption Status for {selected_sensor} ({selected_year})')
     
     return fig
 
@@ -3,13 +3,13 @@ from flask import Flask
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
-import sqlite3
+import functools
+import json
 import pandas as pd
 import os
-import plotly.express as px
 import numpy as np
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from db import POOL_SIZE, prepare_database, read_sql, time_columns, parse_time
 
 # Initialize Flask
 server = Flask(__name__)
@@ -17,70 +17,100 @@ server = Flask(__name__)
 # Initialize Dash
 app = dash.Dash(__name__, server=server)
 
-# Database path
-DB_PATH = os.path.join('data', 'text.db')
+# Constants
+SENSORS = ['s1', 's2', 's3', 's4', 's5', 's6']
+BINS = np.arange(0, 18, 0.5)
+CHANNELS = ['ch1', 'ch2', 'ch3']
+COLORS = {'ch1': 'blue', 'ch2': 'red', 'ch3': 'green'}
+
+# Define available metrics
+AVAILABLE_METRICS = ['std_dev', 'rms', 'iqr', 'clean_max', 'clean_min', 'clean_range', 
+                    'outlier_count', 'skewness', 'simpson', 'trapz', 'std_error']
+
+# Per-metric (time, RPM bin index, sensor tensor) arrays; the tensor is (N, channel, sensor)
+_TENSOR_CACHE: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
 
-# Add database path verification
-if not os.path.exists(DB_PATH):
-    print(f"Database file not found at: {DB_PATH}")
-    print(f"Current working directory: {os.getcwd()}")
+prepare_database()
+
+# Downcast numeric columns to halve memory and scan bandwidth
+def downcast(df):
+    df = df.astype({c: 'float32' for c in df.columns if df[c].dtype == 'float64'})
+    return df.astype({'id': 'int32'})
+
+# Index of the 0.5-wide RPM bin each row falls in (-1 when outside BINS)
+def to_rpm_bins(rpm):
+    idx = np.floor(rpm * 2)
+    return np.where((idx >= 0) & (idx < len(BINS)), idx, -1).astype(np.int8)
+
+# RPM is the same for every metric, so load it once as sorted ids and bin
+# indices. Bins are computed from the float64 values so edges stay exact.
+def load_rpm():
+    df_rpm = read_sql('SELECT id, ch1s1 FROM rpm ORDER BY id')
+    print(f"rpm data rows: {len(df_rpm)}")
+    return df_rpm['id'].to_numpy(), to_rpm_bins(df_rpm['ch1s1'].to_numpy(dtype=float))
+
+RPM_IDS, RPM_BINS = load_rpm()
 
 # Data Loading and Preprocessing
 def load_data(metric='std_dev'):
+    # Metric is interpolated into SQL, so only accept known table names
+    if metric not in AVAILABLE_METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+
     try:
-        # Create a new connection each time (don't use the global conn)
-        with sqlite3.connect(DB_PATH) as conn:
-            # Load main datasets
-            print(f"Loading data for metric: {metric}")
-            df = pd.read_sql('SELECT * FROM main_data', conn)
-            print(f"main_data rows: {len(df)}")
-            
-            df_rpm = pd.read_sql('SELECT * FROM rpm', conn)
-            print(f"rpm data rows: {len(df_rpm)}")
-            
-            df1 = pd.read_sql(f'SELECT * FROM {metric}', conn)
-            print(f"{metric} data rows: {len(df1)}")
-            
-            # Merge dataframes
-            merged_df1 = pd.merge(df, df1, on='id', how='inner')
-            print(f"merged_df1 rows after first merge: {len(merged_df1)}")
-            
-            merged_df2 = pd.merge(df, df_rpm, on='id', how='inner')
-            print(f"merged_df2 rows after second merge: {len(merged_df2)}")
-            
-            # Convert time columns
-            merged_df1['time'] = pd.to_datetime(merged_df1['time'])
-            merged_df2['time'] = pd.to_datetime(merged_df2['time'])
-            
-            return merged_df1, merged_df2, metric
+        cols = ', '.join(f'x.{ch}{s}' for ch in CHANNELS for s in SENSORS)
+        
+        # Join and project only the used columns inside SQLite
+        print(f"Loading data for metric: {metric}")
+        merged_df1 = read_sql(
+            f'SELECT m.id, {time_columns("m")}, {cols} FROM main_data m JOIN {metric} x ON m.id = x.id')
+        print(f"merged_df1 rows: {len(merged_df1)}")
+        
+        # Convert times before downcasting so epoch seconds keep full precision
+        return downcast(parse_time(merged_df1))
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         raise
 
-# Define available metrics
-AVAILABLE_METRICS = ['std_dev', 'rms', 'iqr', 'clean_max', 'clean_min', 'clean_range', 
-                    'outlier_count', 'skewness', 'simpson', 'trapz', 'std_error']
+# Coalesce a metric's sensor columns into one (N, 3, 6) float32 block so
+# callbacks slice arrays instead of filtering a DataFrame
+def to_sensor_tensor(df):
+    cols = [f'{ch}{s}' for ch in CHANNELS for s in SENSORS]
+    return df[cols].to_numpy(dtype=np.float32).reshape(-1, len(CHANNELS), len(SENSORS))
 
-# Load initial data with std_dev as default
-merged_df1, merged_df2, metric = load_data(metric='std_dev')
+def build_tensor(merged_df1):
+    # Look each row's RPM bin up by id; rows without RPM data get -1
+    ids = merged_df1['id'].to_numpy()
+    has_rpm = np.isin(ids, RPM_IDS)
+    rpm_bins = np.full(len(ids), -1, dtype=np.int8)
+    rpm_bins[has_rpm] = RPM_BINS[np.searchsorted(RPM_IDS, ids[has_rpm])]
+    
+    time = merged_df1['time'].to_numpy('datetime64[s]')
+    return time, rpm_bins, to_sensor_tensor(merged_df1)
 
-# Constants
-SENSORS = ['s1', 's2', 's3', 's4', 's5', 's6']
-BINS = np.arange(0, 18, 0.5)
-CHANNELS = ['ch1', 'ch2', 'ch3']
-COLORS = {'ch1': 'blue', 'ch2': 'red', 'ch3': 'green'}
+# Only the arrays are kept; the DataFrame is dropped once converted
+def load_tensor(metric='std_dev'):
+    if metric not in _TENSOR_CACHE:
+        _TENSOR_CACHE[metric] = build_tensor(load_data(metric=metric))
+    return _TENSOR_CACHE[metric]
+
+# Pre-warm the cache so callbacks never hit the database, one metric per
+# pooled connection at a time
+with ThreadPoolExecutor(POOL_SIZE) as ex:
+    list(ex.map(load_tensor, AVAILABLE_METRICS))
+
+# Default view uses std_dev
+TIME, _, SENSOR_TENSOR = load_tensor(metric='std_dev')
 
 # Calculate default y-limits
 def calculate_y_limits():
-    all_values = []
-    for ch in CHANNELS:
-        for s in SENSORS:
-            col = f'{ch}{s}'
-            all_values.extend(merged_df1[col].dropna().values)
-    return np.percentile(all_values, [2.5, 97.5])
+    return np.nanpercentile(SENSOR_TENSOR, [2.5, 97.5])
 
 y_min, y_max = calculate_y_limits()
 
+# Default date range spans the rows that have a time; NaT would poison min/max
+_VALID_TIME = TIME[~np.isnat(TIME)]
+
 # App Layout
 app.layout = html.Div([
     html.H1("Sensor Data Analysis Dashboard"),
@@ -160,8 +190,8 @@ app.layout = html.Div([
         html.H3("Select Date Range"),
         dcc.DatePickerRange(
             id='date-picker',
-            start_date=merged_df1['time'].min().date(),
-            end_date=merged_df1['time'].max().date(),
+            start_date=_VALID_TIME.min().astype('datetime64[D]').item(),
+            end_date=_VALID_TIME.max().astype('datetime64[D]').item(),
             display_format='YYYY-MM-DD'
         )
     ], style={'marginTop': '20px'}),
@@ -173,6 +203,31 @@ app.layout = html.Div([
 ])
 
 
+# Static graph layout built once; callbacks only add traces, title and y-range.
+# Kept as a plain dict so plotly.graph_objects is only imported by callbacks.
+_GRAPH_LAYOUT = dict(
+    xaxis_title='Time',
+    yaxis_title='Value',
+    showlegend=True,
+    height=600,
+    legend_title='Channel'
+)
+
+# Trailing moving average over daily rows that skips NaN days,
+# equivalent to rolling(window, min_periods=1).mean()
+def trailing_mean(values, window):
+    n = len(values)
+    if n == 0:
+        return values
+    kernel = np.ones(window)
+    valid = ~np.isnan(values)
+    convolve = lambda c: np.convolve(c, kernel)[:n]
+    sums = np.apply_along_axis(convolve, 0, np.where(valid, values, 0.0))
+    counts = np.apply_along_axis(convolve, 0, valid.astype(float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
 # Update the callback to include metric selection
 @app.callback(
     Output('sensor-graph', 'figure'),
@@ -186,35 +241,32 @@ app.layout = html.Div([
      Input('ma-slider', 'value')]
 )
 def update_graph(selected_metric, selected_sensor, rpm_bin, start_date, end_date, y_min, y_max, ma_days):
-    # Load data with selected metric
-    merged_df1, merged_df2, metric = load_data(metric=selected_metric)
+    import plotly.graph_objects as go
     
-    # Date filtering
-    mask = (merged_df1['time'].dt.date >= pd.to_datetime(start_date).date()) & \
-           (merged_df1['time'].dt.date <= pd.to_datetime(end_date).date())
-    df_filtered = merged_df1[mask].sort_values('time')
+    time, rpm_bins, tensor = load_tensor(metric=selected_metric)
     
-    # RPM filtering
-    rpm_mask = (merged_df2['ch1s1'] >= rpm_bin) & (merged_df2['ch1s1'] < (rpm_bin + 0.5))
-    rpm_filtered = merged_df2[rpm_mask].sort_values('time')
+    # RPM bin and date filtering on the precomputed arrays
+    # Whole-day bounds as datetime64, compared directly against the time array
+    start = np.datetime64(start_date, 'D')
+    end = np.datetime64(end_date, 'D') + np.timedelta64(1, 'D')
+    mask = (rpm_bins == int(rpm_bin * 2)) & (time >= start) & (time < end)
+    values = tensor[mask, :, SENSORS.index(selected_sensor)]
     
-    # Combine filtered data
-    final_df = pd.merge(df_filtered, rpm_filtered[['id', 'time']], on=['id', 'time'])
-    final_df = final_df.sort_values('time')
+    # Daily means for all channels in one groupby, on a dense daily index
+    days = time[mask].astype('datetime64[D]')
+    daily = pd.DataFrame(values, columns=CHANNELS).groupby(days).mean()
+    if len(daily):
+        daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq='D'))
+    ma_values = trailing_mean(daily.to_numpy(dtype=float), ma_days)
     
-    # Create figure
-    fig = go.Figure()
+    # Create figure from the shared static layout
+    fig = go.Figure(layout=_GRAPH_LAYOUT)
     
     # Add traces for each channel
-    for ch in CHANNELS:
-        col_name = f'{ch}{selected_sensor}'
-        ma_window = f'{ma_days}D'
-        ma_data = final_df.set_index('time')[col_name].resample('D').mean().rolling(
-            window=ma_days, min_periods=1).mean()
-        
+    for i, ch in enumerate(CHANNELS):
         fig.add_trace(go.Scatter(
-            x=ma_data.index,
-            y=ma_data.values,
+            x=daily.index,
+            y=ma_values[:, i],
             mode='lines+markers',
             name=f'Channel {ch} ({ma_days}-day MA)',
             line=dict(color=COLORS[ch], width=1.5, shape='linear'),
@@ -226,17 +278,27 @@ def update_graph(selected_metric, selected_sensor, rpm_bin, start_date, end_date
     # Update layout
     fig.update_layout(
         title=f'{selected_metric.replace("_", " ").title()} - Sensor {selected_sensor} Data for RPM {rpm_bin}-{rpm_bin+0.5} ({ma_days}-day Moving Average)',
-        xaxis_title='Time',
-        yaxis_title='Value',
-        yaxis=dict(range=[y_min, y_max]),
-        showlegend=True,
-        height=600,
-        legend_title='Channel'
+        yaxis_range=[y_min, y_max]
     )
     
     return fig
 
 
+# Kaleido rendering is expensive; reuse bytes for figures already rendered.
+# The serialized figure fully determines the image, so it is the cache key.
+@functools.lru_cache(maxsize=64)
+def render_png(figure_json):
+    import plotly.graph_objects as go
+    
+    return go.Figure(json.loads(figure_json)).to_image(
+        format='png',
+        width=1920,
+        height=1080,
+        scale=2.0,
+        engine='kaleido'
+    )
+
+
 # Also update the download callback to use selected_metric
 @app.callback(
     Output("download-graph", "data"),
@@ -251,13 +313,7 @@ def update_graph(selected_metric, selected_sensor, rpm_bin, start_date, end_date
 def download_graph(n_clicks, selected_metric, selected_sensor, rpm_bin, ma_days, figure):
     if n_clicks:
         filename = f'{selected_metric}_Sensor_{selected_sensor}_RPM_{rpm_bin}-{rpm_bin+0.5}_MA_{ma_days}days.png'
-        img_bytes = go.Figure(figure).to_image(
-            format='png',
-            width=1920,
-            height=1080,
-            scale=2.0,
-            engine='kaleido'
-        )
+        img_bytes = render_png(json.dumps(figure, sort_keys=True))
         return dcc.send_bytes(img_bytes, filename)
 
 if __name__ == "__main__":
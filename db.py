@@ -0,0 +1,117 @@
+# Shared SQLite access for the dashboard apps
+import sqlite3
+import pandas as pd
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Database path
+DB_PATH = os.path.join('data', 'text.db')
+
+# Add database path verification
+if not os.path.exists(DB_PATH):
+    print(f"Database file not found at: {DB_PATH}")
+    print(f"Current working directory: {os.getcwd()}")
+
+# Read-side SQLite tuning for the shared connection
+SQLITE_PRAGMAS = [
+    'PRAGMA query_only=1',
+    'PRAGMA cache_size=-200000',
+    'PRAGMA mmap_size=268435456',
+]
+
+# Open a long-lived read-only connection for the pool
+def open_connection():
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# Persist time as epoch seconds so loads skip parsing ISO-8601 strings.
+# Runs under a write lock, and only checks and fills rows still missing it;
+# the index keeps both lookups cheap once the table has been migrated.
+# strftime('%s') returns NULL for strings SQLite cannot parse and shifts strings
+# with a UTC offset to UTC, so a row that is unparseable, lacks a leading
+# YYYY-MM-DD date or carries an offset aborts the migration and loads keep
+# parsing the text instead.
+def migrate_time_epoch(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(main_data)')]
+        if 'time_epoch' not in columns:
+            conn.execute('ALTER TABLE main_data ADD COLUMN time_epoch INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_main_time_epoch ON main_data(time_epoch)')
+        unconverted = conn.execute(
+            "SELECT COUNT(*) FROM main_data WHERE time_epoch IS NULL AND time IS NOT NULL AND ("
+            "datetime(time) IS NULL "
+            "OR datetime(CAST(strftime('%s', time) AS INTEGER), 'unixepoch') IS NOT datetime(time) "
+            "OR time NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' "
+            "OR instr(substr(time, 11), '+') OR instr(substr(time, 11), '-') "
+            "OR instr(upper(substr(time, 11)), 'Z'))"
+        ).fetchone()[0]
+        if unconverted:
+            raise ValueError(f"{unconverted} main_data times cannot be stored as epoch seconds")
+        conn.execute("UPDATE main_data SET time_epoch = CAST(strftime('%s', time) AS INTEGER) "
+                     "WHERE time_epoch IS NULL AND time IS NOT NULL")
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+# One-off writable setup: add epoch times. Best-effort, since the data
+# directory may be mounted read-only (see docker-compose.yml).
+def prepare_database():
+    if not os.access(DB_PATH, os.W_OK):
+        print(f"Skipping database setup: {DB_PATH} is not writable")
+        return
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=60, isolation_level=None)
+        try:
+            migrate_time_epoch(conn)
+        finally:
+            conn.close()
+    except (sqlite3.OperationalError, ValueError) as e:
+        print(f"Skipping database setup: {e}")
+
+# Small pool of long-lived read-only connections. A connection is only ever
+# used by one thread at a time, so independent queries can run concurrently.
+POOL_SIZE = 3
+_POOL = queue.Queue()
+for _ in range(POOL_SIZE):
+    _POOL.put(open_connection())
+
+def read_sql(query, params=None):
+    conn = _POOL.get()
+    try:
+        return pd.read_sql(query, conn, params=params)
+    finally:
+        _POOL.put(conn)
+
+# Run independent queries at once; SQLite releases the GIL while stepping
+def read_sql_parallel(*queries):
+    with ThreadPoolExecutor(len(queries)) as ex:
+        futures = [ex.submit(read_sql, *q) for q in queries]
+        return [f.result() for f in futures]
+
+def has_time_epoch():
+    return 'time_epoch' in set(read_sql('PRAGMA table_info(main_data)')['name'])
+
+# Time columns to select from main_data: the migrated epoch column when present,
+# plus the text time only for rows the migration has not filled
+def time_columns(alias=''):
+    p = f'{alias}.' if alias else ''
+    if has_time_epoch():
+        return f'{p}time_epoch, CASE WHEN {p}time_epoch IS NULL THEN {p}time END AS time'
+    return f'{p}time'
+
+# Turn the columns from time_columns() into a datetime 'time' column
+def parse_time(df):
+    if 'time_epoch' in df:
+        time = pd.to_datetime(df.pop('time_epoch'), unit='s')
+        missing = time.isna() & df['time'].notna()
+        if missing.any():
+            time[missing] = pd.to_datetime(df.loc[missing, 'time'])
+        df['time'] = time
+    else:
+        df['time'] = pd.to_datetime(df['time'])
+    return df